@@ -1,40 +1,712 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from pydantic import BaseModel
-from playwright.async_api import async_playwright
-from fastapi.responses import JSONResponse, StreamingResponse
-from fastapi.middleware.cors import CORSMiddleware
-import json
+from playwright.async_api import BrowserContext, Page, async_playwright
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlsplit
+from cachetools import TTLCache
+import functools
+import hashlib
+import logging
+import os
+import queue
+import sys
 import time
+import uuid
 import asyncio
+import orjson
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+playwright_instance = None
 browser_instance = None
-page = None
 
 # ------------------------------------------------------------
-# CORS Middleware
+# CORS Middleware (everything is allowed, so the headers are precomputed)
 # ------------------------------------------------------------
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+_CORS_HEADERS = [
+    (b"access-control-allow-credentials", b"true"),
+    # Browser clients must read these to keep their own browser session
+    # (Mcp-Session-Id) and to send If-None-Match (ETag).
+    (b"access-control-expose-headers", b"Mcp-Session-Id, ETag"),
+    (b"vary", b"Origin"),
+]
+_PREFLIGHT_HEADERS = [
+    (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+    (b"access-control-allow-credentials", b"true"),
+    (b"access-control-max-age", b"600"),
+    (b"vary", b"Origin"),
+]
+
+
+class StaticCORSMiddleware:
+    """Open CORS as a pure ASGI middleware with precomputed headers.
+
+    OPTIONS requests are answered with a 204 preflight without reaching the
+    app. Both preflights and regular responses echo the request's Origin
+    (and the preflight its Access-Control-Request-Headers) rather than "*",
+    since browsers refuse "*" alongside allow-credentials.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if scope["method"] == "OPTIONS":
+            headers = list(_PREFLIGHT_HEADERS)
+            for key, value in scope["headers"]:
+                if key == b"origin":
+                    headers.append((b"access-control-allow-origin", value))
+                elif key == b"access-control-request-headers":
+                    headers.append((b"access-control-allow-headers", value))
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        origin = next((value for key, value in scope["headers"] if key == b"origin"), None)
+        if origin is None:  # not a cross-origin request
+            return await self.app(scope, receive, send)
+        cors_headers = [(b"access-control-allow-origin", origin)] + _CORS_HEADERS
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + cors_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+app.add_middleware(StaticCORSMiddleware)
+
+
+# ------------------------------------------------------------
+# Logging (records are queued; a listener thread does the writes)
+# ------------------------------------------------------------
+log = logging.getLogger("mcp")
+log.setLevel(os.environ.get("MCP_LOG_LEVEL", "INFO").upper())
+log.propagate = False
+_log_listener = None
+
+
+@app.on_event("startup")
+async def start_logging():
+    """Attach the queue handler and start its listener thread.
+
+    Done here rather than at import: `python mcp_browser_server.py` and
+    worker processes execute this file more than once, and each import
+    would otherwise add a handler whose queue nothing drains.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    log.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, stream)
+    _log_listener.start()
+
+
+def _stop_logging():
+    """Flush and detach the queue handler; called last by the shutdown hook."""
+    global _log_listener
+    if _log_listener is None:
+        return
+    for handler in list(log.handlers):
+        if isinstance(handler, QueueHandler):
+            log.removeHandler(handler)
+    _log_listener.stop()
+    _log_listener = None
 
 
 # ------------------------------------------------------------
 # Async Browser Setup
 # ------------------------------------------------------------
+# Headless-only switches on top of Playwright's defaults (which already
+# cover sandboxing, first-run, popup and background throttling flags).
+CHROMIUM_ARGS = [
+    "--disable-gpu",
+    "--disable-accelerated-2d-canvas",
+    "--disable-webgl",
+    "--disable-dev-shm-usage",
+    "--no-zygote",
+]
+
+
+_browser_lock = asyncio.Lock()
+
+
 async def ensure_browser():
     """Launch Playwright Chromium asynchronously and reuse it."""
-    global browser_instance, page
+    global playwright_instance, browser_instance
     if browser_instance is None:
-        pw = await async_playwright().start()
-        browser_instance = await pw.chromium.launch(headless=True)
-        page = await browser_instance.new_page()
-        print("🟢 Async browser launched")
-    return page
+        async with _browser_lock:
+            if browser_instance is None:
+                playwright_instance = await async_playwright().start()
+                browser_instance = await playwright_instance.chromium.launch(
+                    headless=True, args=CHROMIUM_ARGS
+                )
+                log.info("🟢 Async browser launched")
+    return browser_instance
+
+
+# ------------------------------------------------------------
+# Browser Context Pool (one context per MCP session, recycled)
+# ------------------------------------------------------------
+POOL_SIZE = 4  # live contexts; the least recently used session is evicted
+CONTEXT_MAX_GOTOS = 50  # recycle a context after this many navigations...
+CONTEXT_MAX_AGE = 600.0  # ...or once it is this many seconds old
+DEFAULT_SESSION = "default"  # used by clients that send no Mcp-Session-Id
+WAIT_UNTIL = "domcontentloaded"  # don't wait for images, ads and trackers
+NAVIGATION_TIMEOUT_MS = 15000
+
+# Subresources the text/click tools never need; aborted before they load.
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+BLOCKED_HOSTS = frozenset(
+    {
+        "google-analytics.com",
+        "googletagmanager.com",
+        "googlesyndication.com",
+        "googleadservices.com",
+        "doubleclick.net",
+        "adservice.google.com",
+        "connect.facebook.net",
+        "hotjar.com",
+        "scorecardresearch.com",
+        "segment.io",
+        "amazon-adsystem.com",
+        "taboola.com",
+        "outbrain.com",
+    }
+)
+_BLOCKED_HOST_SUFFIXES = tuple("." + host for host in BLOCKED_HOSTS)
+
+_sessions = OrderedDict()
+_pool_lock = asyncio.Lock()
+# Evicted session ids; their next non-opening call is told to start over
+# instead of silently landing on a blank page.
+_expired_sessions = TTLCache(maxsize=1024, ttl=3600)
+
+
+class SessionExpired(Exception):
+    pass
+
+
+async def _block_heavy_requests(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return await route.abort()
+    host = urlsplit(request.url).hostname or ""
+    if host in BLOCKED_HOSTS or host.endswith(_BLOCKED_HOST_SUFFIXES):
+        return await route.abort()
+    await route.continue_()
+
+
+@dataclass
+class BrowserSession:
+    """A BrowserContext and its page, owned by a single MCP session."""
+
+    context: BrowserContext
+    page: Page
+    created: float = field(default_factory=time.monotonic)
+    gotos: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Set when open_url was answered from URL_CACHE without navigating; the
+    # page catches up on the next call that actually needs it.
+    deferred_url: Optional[str] = None
+    deferred_text: Optional[str] = None
+    deferred_wait: str = WAIT_UNTIL
+    # Set once the session clicks or fills a form; from then on its pages may
+    # reflect per-user state, so they bypass the shared URL_CACHE.
+    interacted: bool = False
+    closed: bool = False
+
+    @classmethod
+    async def open(cls):
+        context = await browser_instance.new_context()
+        # Routed on the context, not the page, so recycling also drops the handler.
+        await context.route("**/*", _block_heavy_requests)
+        return cls(context, await context.new_page())
+
+    def is_stale(self):
+        age = time.monotonic() - self.created
+        return self.gotos >= CONTEXT_MAX_GOTOS or age >= CONTEXT_MAX_AGE
+
+    async def goto(self, url, wait_until=WAIT_UNTIL):
+        """Navigate the page, first swapping in a fresh context if this one is worn out.
+
+        Recycling right before a navigation means no page state the client
+        still relies on is lost; Chromium only frees a context's memory when
+        the context is closed.
+        """
+        if self.is_stale():
+            await self.context.close()
+            fresh = await BrowserSession.open()
+            self.context, self.page = fresh.context, fresh.page
+            self.created, self.gotos = fresh.created, 0
+            self.interacted = False  # fresh context, no cookies or form state
+        self.deferred_url = self.deferred_text = None
+        self.gotos += 1
+        return await self.page.goto(
+            url, wait_until=wait_until, timeout=NAVIGATION_TIMEOUT_MS
+        )
+
+    def defer(self, url, text, wait_until=WAIT_UNTIL):
+        self.deferred_url, self.deferred_text = url, text
+        self.deferred_wait = wait_until
+
+    async def live_page(self):
+        """The page, after performing any navigation open_url deferred."""
+        if self.deferred_url is not None:
+            await self.goto(self.deferred_url, wait_until=self.deferred_wait)
+        return self.page
+
+    async def close(self):
+        async with self.lock:
+            self.closed = True
+            await self.context.close()
+
+
+def _evict_idle_sessions(keep):
+    """Drop least recently used sessions over POOL_SIZE, skipping busy ones.
+
+    A session whose lock is held (or keep, the one being handed out) is never
+    evicted; if every candidate is busy the pool stays over size until a
+    later call.
+    """
+    evicted = []
+    for session_id in list(_sessions):
+        if len(_sessions) <= POOL_SIZE:
+            break
+        session = _sessions[session_id]
+        if session_id == keep or session.lock.locked():
+            continue
+        del _sessions[session_id]
+        _expired_sessions[session_id] = True
+        log.info("♻️ Evicting browser session %s", session_id)
+        evicted.append(session)
+    return evicted
+
+
+@asynccontextmanager
+async def acquire_session(session_id, reopen=False):
+    """Yield the BrowserSession for session_id with its page locked.
+
+    Calls within one session run one at a time so concurrent requests can't
+    interleave navigations and reads on the same page; different sessions
+    proceed in parallel. A session that was evicted raises SessionExpired
+    until a call that opens a page (reopen=True) starts it afresh.
+    """
+    await ensure_browser()
+    async with _pool_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            if session_id in _expired_sessions:
+                if not reopen:
+                    raise SessionExpired("session expired, call open_url again")
+                del _expired_sessions[session_id]
+            session = _sessions[session_id] = await BrowserSession.open()
+            evicted = _evict_idle_sessions(keep=session_id)
+        else:
+            _sessions.move_to_end(session_id)
+            evicted = []
+    for stale in evicted:
+        await stale.close()
+    async with session.lock:
+        if session.closed:  # evicted while this call waited for the lock
+            raise SessionExpired("session expired, call open_url again")
+        yield session
+
+
+# ------------------------------------------------------------
+# Static Payloads (encoded once; per-request values are spliced into slots)
+# ------------------------------------------------------------
+_WAIT_SCHEMA = {
+    "type": "string",
+    "enum": ["commit", "domcontentloaded", "load", "networkidle"],
+    "description": "Navigation event to wait for (default: domcontentloaded)",
+}
+
+TOOLS = [
+    {
+        "name": "open_url",
+        "description": "Open a URL in the browser (recently opened URLs are served from a 5 minute cache unless cache_bypass is set)",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "url": {"type": "string"},
+                "cache_bypass": {"type": "boolean"},
+                "wait": _WAIT_SCHEMA,
+            },
+            "required": ["url"],
+        },
+    },
+    {
+        "name": "click",
+        "description": "Click an element by CSS selector",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"selector": {"type": "string"}},
+            "required": ["selector"],
+        },
+    },
+    {
+        "name": "fill_form",
+        "description": "Fill a form field",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "selector": {"type": "string"},
+                "text": {"type": "string"},
+            },
+            "required": ["selector", "text"],
+        },
+    },
+    {
+        "name": "get_text",
+        "description": "Retrieve the first 1000 characters of the page text",
+        "inputSchema": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "open_and_extract",
+        "description": "Open a URL and return its title and first 1000 characters of text in one call",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "url": {"type": "string"},
+                "cache_bypass": {"type": "boolean"},
+                "wait": _WAIT_SCHEMA,
+            },
+            "required": ["url"],
+        },
+    },
+]
+
+_PROTOCOL_VERSION_SLOT = b'"__PROTOCOL_VERSION__"'
+_TEXT_SLOT = b'"__TEXT__"'
+_MESSAGE_SLOT = b'"__MESSAGE__"'
+_METHOD_SLOT = b"__METHOD__"
+_ID_SLOT = b'"id":null'
+
+_INITIALIZE_TEMPLATE = orjson.dumps(
+    {
+        "jsonrpc": "2.0",
+        "id": None,
+        "result": {
+            "protocolVersion": "__PROTOCOL_VERSION__",
+            "capabilities": {
+                "tools": {"supported": True},
+                "browsing": {"supported": True},
+                "experimental": {},
+            },
+            "serverInfo": {
+                "name": "mcp-browser",
+                "version": "0.2.0",
+                "description": "Async Playwright MCP browser agent",
+            },
+        },
+    }
+)
+_TOOLS_LIST_TEMPLATE = orjson.dumps(
+    {"jsonrpc": "2.0", "id": None, "result": {"tools": TOOLS}}
+)
+_ACK_TEMPLATE = orjson.dumps({"jsonrpc": "2.0", "id": None, "result": {"ack": True}})
+_TOOL_RESULT_TEMPLATE = orjson.dumps(
+    {
+        "jsonrpc": "2.0",
+        "id": None,
+        "result": {"content": [{"type": "text", "text": "__TEXT__"}]},
+    }
+)
+_TOOL_ERROR_TEMPLATE = orjson.dumps(
+    {"jsonrpc": "2.0", "id": None, "error": {"code": -32000, "message": "__MESSAGE__"}}
+)
+_INVALID_PARAMS_TEMPLATE = orjson.dumps(
+    {"jsonrpc": "2.0", "id": None, "error": {"code": -32602, "message": "__MESSAGE__"}}
+)
+_METHOD_NOT_FOUND_TEMPLATE = orjson.dumps(
+    {
+        "jsonrpc": "2.0",
+        "id": None,
+        "error": {"code": -32601, "message": "Method '__METHOD__' not implemented"},
+    }
+)
+_INVALID_JSON = orjson.dumps({"error": "invalid JSON"})
+_INVALID_REQUEST_TEMPLATE = orjson.dumps(
+    {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "__MESSAGE__"}}
+)
+_TOOL_RESULT_HEAD, _TOOL_RESULT_TAIL = _TOOL_RESULT_TEMPLATE.split(_TEXT_SLOT, 1)
+
+STREAM_THRESHOLD = 32 * 1024  # bytes; encoded tool results this large are streamed
+_STREAM_CHUNK = 16 * 1024  # characters of text escaped per streamed chunk
+
+
+def _with_id(template: bytes, req_id) -> bytes:
+    """Splice the request id into a pre-encoded JSON-RPC response."""
+    return template.replace(_ID_SLOT, b'"id":' + orjson.dumps(req_id), 1)
+
+
+def _fill(template: bytes, req_id, slot: bytes, value: bytes) -> bytes:
+    """Splice an encoded value into a template's slot, then the request id.
+
+    The slot goes first so an id that happens to look like a slot can't
+    capture the value.
+    """
+    return _with_id(template.replace(slot, value, 1), req_id)
+
+
+def _json_bytes(payload: bytes, headers=None) -> Response:
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
+async def _stream_tool_result(req_id, text: str):
+    """Yield a tools/call response, escaping the text field chunk by chunk.
+
+    The caller already holds text in full; this only avoids also building
+    its JSON-escaped copy and the complete response body on top of it.
+    """
+    yield _with_id(_TOOL_RESULT_HEAD, req_id) + b'"'
+    for start in range(0, len(text), _STREAM_CHUNK):
+        yield orjson.dumps(text[start : start + _STREAM_CHUNK])[1:-1]
+    yield b'"' + _TOOL_RESULT_TAIL
+
+
+def _etag(template: bytes) -> str:
+    return '"%s"' % hashlib.sha256(template).hexdigest()
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True if the client's If-None-Match already names this ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return any(
+        tag.strip().removeprefix("W/") in (etag, "*") for tag in header.split(",")
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _initialize_template(protocol_version: str):
+    """The initialize template for one protocol version, and its ETag."""
+    template = _INITIALIZE_TEMPLATE.replace(
+        _PROTOCOL_VERSION_SLOT, orjson.dumps(protocol_version), 1
+    )
+    return template, _etag(template)
+
+
+_TOOLS_LIST_ETAG = _etag(_TOOLS_LIST_TEMPLATE)
+
+
+# ------------------------------------------------------------
+# Browser Tools
+# ------------------------------------------------------------
+# Slice inside the page so only 1000 chars cross the Playwright pipe.
+_TEXT_HEAD_JS = "() => ((document.body && document.body.innerText) || '').slice(0, 1000)"
+_SNAPSHOT_JS = (
+    "() => [document.title,"
+    " ((document.body && document.body.innerText) || '').slice(0, 1000)]"
+)
+
+# (url, wait_until) -> {"title", "text"} for recently opened pages. Shared by
+# all sessions, so it only holds pages fetched by sessions that have not yet
+# clicked or filled anything (i.e. carry no per-user state).
+URL_CACHE = TTLCache(maxsize=512, ttl=300)
+
+
+async def _open(session, url, cache_bypass=False, wait_until=WAIT_UNTIL):
+    """Load url in the session, or answer from URL_CACHE and defer the navigation."""
+    use_cache = not (cache_bypass or session.interacted)
+    key = (url, wait_until)
+    snapshot = URL_CACHE.get(key) if use_cache else None
+    if snapshot is not None:
+        session.defer(url, snapshot["text"], wait_until)
+        return snapshot
+    await session.goto(url, wait_until=wait_until)
+    title, text = await session.page.evaluate(_SNAPSHOT_JS)
+    snapshot = {"title": title, "text": text}
+    if use_cache:
+        URL_CACHE[key] = snapshot
+    return snapshot
+
+
+async def _tool_open_url(session, args):
+    snapshot = await _open(
+        session,
+        args["url"],
+        args.get("cache_bypass", False),
+        args.get("wait", WAIT_UNTIL),
+    )
+    return {"title": snapshot["title"], "url": args["url"]}
+
+
+async def _tool_click(session, args):
+    page = await session.live_page()
+    session.interacted = True
+    await page.click(args["selector"])
+    return {"status": "clicked", "selector": args["selector"]}
+
+
+async def _tool_fill_form(session, args):
+    page = await session.live_page()
+    session.interacted = True
+    await page.fill(args["selector"], args["text"])
+    return {"status": "filled", "selector": args["selector"], "text": args["text"]}
+
+
+async def _tool_get_text(session, args):
+    if session.deferred_url is not None:
+        return {"text": session.deferred_text}
+    return {"text": await session.page.evaluate(_TEXT_HEAD_JS)}
+
+
+async def _tool_open_and_extract(session, args):
+    # open_url + get_text fused: one goto and one evaluate, one JSON-RPC call.
+    snapshot = await _open(
+        session,
+        args["url"],
+        args.get("cache_bypass", False),
+        args.get("wait", WAIT_UNTIL),
+    )
+    return {"title": snapshot["title"], "text": snapshot["text"], "url": args["url"]}
+
+
+TOOL_HANDLERS = {
+    "open_url": _tool_open_url,
+    "click": _tool_click,
+    "fill_form": _tool_fill_form,
+    "get_text": _tool_get_text,
+    "open_and_extract": _tool_open_and_extract,
+}
+# Tools that load a fresh page, and so may start over an expired session.
+OPENING_TOOLS = frozenset({"open_url", "open_and_extract"})
+
+# Required arguments per tool, taken from the advertised inputSchema so they
+# are checked once up front rather than surfacing as KeyErrors mid-tool.
+TOOL_REQUIRED_ARGS = {
+    tool["name"]: tuple(tool["inputSchema"].get("required", ())) for tool in TOOLS
+}
+# ...and the allowed values of each enum-typed argument (e.g. "wait").
+TOOL_ENUM_ARGS = {
+    tool["name"]: {
+        key: frozenset(prop["enum"])
+        for key, prop in tool["inputSchema"].get("properties", {}).items()
+        if "enum" in prop
+    }
+    for tool in TOOLS
+}
+# ...and the declared JSON type of each argument.
+_JSON_TYPES = {"string": str, "boolean": bool}
+TOOL_ARG_TYPES = {
+    tool["name"]: {
+        key: prop["type"]
+        for key, prop in tool["inputSchema"].get("properties", {}).items()
+        if prop.get("type") in _JSON_TYPES
+    }
+    for tool in TOOLS
+}
+
+
+def _invalid_tool_args(name, args):
+    """Return an error message if args don't satisfy the tool's schema, else None."""
+    if not isinstance(args, dict):
+        return "Invalid params: arguments must be an object"
+    missing = [key for key in TOOL_REQUIRED_ARGS[name] if key not in args]
+    if missing:
+        return f"Invalid params for {name}: missing {', '.join(missing)}"
+    for key, json_type in TOOL_ARG_TYPES[name].items():
+        if key in args and not isinstance(args[key], _JSON_TYPES[json_type]):
+            return f"Invalid params for {name}: {key} must be a {json_type}"
+    for key, allowed in TOOL_ENUM_ARGS[name].items():
+        value = args.get(key)
+        if key in args and not (isinstance(value, str) and value in allowed):
+            return f"Invalid params for {name}: {key} must be one of {', '.join(sorted(allowed))}"
+    return None
+
+
+# ------------------------------------------------------------
+# JSON-RPC Method Handlers
+# ------------------------------------------------------------
+async def _handle_initialize(req_id, params, request):
+    protocol_version = params.get("protocolVersion")
+    if not isinstance(protocol_version, str):
+        protocol_version = "2025-06-18"
+    template, etag = _initialize_template(protocol_version)
+    headers = {"ETag": etag, "Mcp-Session-Id": uuid.uuid4().hex}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    payload = _with_id(template, req_id)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("✅ Responding to initialize: %s", payload.decode())
+    return _json_bytes(payload, headers)
+
+
+async def _handle_tools_list(req_id, params, request):
+    headers = {"ETag": _TOOLS_LIST_ETAG}
+    if _etag_matches(request, _TOOLS_LIST_ETAG):
+        return Response(status_code=304, headers=headers)
+    return _json_bytes(_with_id(_TOOLS_LIST_TEMPLATE, req_id), headers)
+
+
+async def _handle_tools_call(req_id, params, request):
+    name = params.get("name")
+    args = params.get("arguments", {})
+    rpc = request.state.rpc
+    rpc["tool"] = name
+
+    try:
+        tool = TOOL_HANDLERS.get(name)
+        if tool is None:
+            raise ValueError(f"Unknown tool: {name}")
+        invalid = _invalid_tool_args(name, args)
+        if invalid is not None:
+            rpc["ok"], rpc["detail"] = False, invalid
+            message = orjson.dumps(invalid)
+            return _json_bytes(_fill(_INVALID_PARAMS_TEMPLATE, req_id, _MESSAGE_SLOT, message))
+        session_id = request.headers.get("mcp-session-id", DEFAULT_SESSION)
+        async with acquire_session(session_id, reopen=name in OPENING_TOOLS) as session:
+            result = await tool(session, args)
+
+        encoded = orjson.dumps(result)
+        if len(encoded) >= STREAM_THRESHOLD:
+            return StreamingResponse(
+                _stream_tool_result(req_id, encoded.decode()), media_type="application/json"
+            )
+        text = orjson.dumps(encoded.decode())
+        return _json_bytes(_fill(_TOOL_RESULT_TEMPLATE, req_id, _TEXT_SLOT, text))
+
+    except Exception as e:
+        rpc["ok"], rpc["detail"] = False, str(e)
+        message = orjson.dumps(str(e))
+        return _json_bytes(_fill(_TOOL_ERROR_TEMPLATE, req_id, _MESSAGE_SLOT, message))
+
+
+async def _handle_initialized(req_id, params, request):
+    return _json_bytes(_with_id(_ACK_TEMPLATE, req_id))
+
+
+async def _handle_cancelled(req_id, params, request):
+    request.state.rpc["detail"] = params  # formatted only if the line is emitted
+    return _json_bytes(_with_id(_ACK_TEMPLATE, req_id))
+
+
+def _method_not_found(req_id, method):
+    name = orjson.dumps(str(method))[1:-1]  # JSON-escaped, without the quotes
+    return _json_bytes(_fill(_METHOD_NOT_FOUND_TEMPLATE, req_id, _METHOD_SLOT, name))
+
+
+HANDLERS = {
+    "initialize": _handle_initialize,
+    "tools/list": _handle_tools_list,
+    "tools/call": _handle_tools_call,
+    "notifications/initialized": _handle_initialized,
+    "notifications/cancelled": _handle_cancelled,
+}
 
 
 # ------------------------------------------------------------
@@ -42,173 +714,91 @@ async def ensure_browser():
 # ------------------------------------------------------------
 @app.post("/")
 async def mcp_router(request: Request):
-    """Handles MCP JSON-RPC methods like initialize, tools/list, tools/call."""
+    """Handles MCP JSON-RPC methods like initialize, tools/list, tools/call.
+
+    Emits exactly one "rpc" log line per request; handlers add to it through
+    request.state.rpc instead of logging themselves.
+    """
+    started = time.perf_counter()
+    rpc = request.state.rpc = {
+        "method": None,
+        "id": None,
+        "tool": None,
+        "ok": True,
+        "detail": None,
+    }
+    try:
+        return await _dispatch(request, rpc)
+    except BaseException as e:
+        rpc["ok"], rpc["detail"] = False, e
+        raise
+    finally:
+        rpc["ms"] = (time.perf_counter() - started) * 1000
+        log.log(
+            logging.INFO if rpc["ok"] else logging.WARNING,
+            "rpc method=%s id=%s tool=%s ok=%s ms=%.1f detail=%s",
+            rpc["method"],
+            rpc["id"],
+            rpc["tool"],
+            rpc["ok"],
+            rpc["ms"],
+            rpc["detail"],
+            extra={"rpc": rpc},
+        )
+
+
+async def _dispatch(request: Request, rpc):
+    raw = await request.body()
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("🔹 LM Studio body: %s", raw.decode(errors="replace"))
+
     try:
-        body = await request.json()
-        print("🔹 LM Studio body:", json.dumps(body, indent=2))
+        body = orjson.loads(raw)
     except Exception:
-        body = {}
-        print("⚠️ Could not parse body; returning default handshake.")
-        return JSONResponse(content={"error": "invalid JSON"})
+        rpc["ok"], rpc["detail"] = False, "invalid JSON"
+        return _json_bytes(_INVALID_JSON)
+
+    if not isinstance(body, dict):  # includes batch arrays, which aren't supported
+        return _invalid(
+            rpc, _INVALID_REQUEST_TEMPLATE, None, "Invalid Request: body must be an object"
+        )
 
     method = body.get("method")
     req_id = body.get("id", 0)
+    rpc["method"], rpc["id"] = method, req_id
+    if not isinstance(method, str):
+        return _invalid(
+            rpc, _INVALID_REQUEST_TEMPLATE, req_id, "Invalid Request: method must be a string"
+        )
     params = body.get("params", {})
-    protocol_version = params.get("protocolVersion", "2025-06-18")
-
-    # ---- initialize ----
-    if method == "initialize":
-        response = {
-            "jsonrpc": "2.0",
-            "id": req_id,
-            "result": {
-                "protocolVersion": protocol_version,
-                "capabilities": {
-                    "tools": {"supported": True},
-                    "browsing": {"supported": True},
-                    "experimental": {},
-                },
-                "serverInfo": {
-                    "name": "mcp-browser",
-                    "version": "0.2.0",
-                    "description": "Async Playwright MCP browser agent",
-                },
-            },
-        }
-        print("✅ Responding to initialize:", json.dumps(response, indent=2))
-        return JSONResponse(content=response)
-
-    # ---- tools/list ----
-    elif method == "tools/list":
-        tools = [
-            {
-                "name": "open_url",
-                "description": "Open a URL in the browser",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {"url": {"type": "string"}},
-                    "required": ["url"],
-                },
-            },
-            {
-                "name": "click",
-                "description": "Click an element by CSS selector",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {"selector": {"type": "string"}},
-                    "required": ["selector"],
-                },
-            },
-            {
-                "name": "fill_form",
-                "description": "Fill a form field",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "selector": {"type": "string"},
-                        "text": {"type": "string"},
-                    },
-                    "required": ["selector", "text"],
-                },
-            },
-            {
-                "name": "get_text",
-                "description": "Retrieve the first 1000 characters of the page text",
-                "inputSchema": {"type": "object", "properties": {}},
-            },
-        ]
-        response = {"jsonrpc": "2.0", "id": req_id, "result": {"tools": tools}}
-        print("✅ Responding to tools/list with", len(tools), "tools.")
-        return JSONResponse(content=response)
-
-    # ---- tools/call ----
-    elif method == "tools/call":
-        name = params.get("name")
-        args = params.get("arguments", {})
-        print(f"🧩 Tool call requested: {name} with args {args}")
-
-        try:
-            p = await ensure_browser()
-            result = {}
-
-            if name == "open_url":
-                await p.goto(args["url"])
-                result = {"title": await p.title(), "url": args["url"]}
-
-            elif name == "click":
-                await p.click(args["selector"])
-                result = {"status": "clicked", "selector": args["selector"]}
-
-            elif name == "fill_form":
-                await p.fill(args["selector"], args["text"])
-                result = {
-                    "status": "filled",
-                    "selector": args["selector"],
-                    "text": args["text"],
-                }
-
-            elif name == "get_text":
-                text = await p.inner_text("body")
-                result = {"text": text[:1000]}
-
-            else:
-                raise ValueError(f"Unknown tool: {name}")
-
-            response = {
-                "jsonrpc": "2.0",
-                "id": req_id,
-                "result": {
-                    "content": [{"type": "text", "text": json.dumps(result, indent=2)}]
-                },
-            }
-
-            print(f"✅ Tool {name} executed successfully.")
-            return JSONResponse(content=response)
-
-        except Exception as e:
-            print(f"❌ Tool execution failed: {e}")
-            response = {
-                "jsonrpc": "2.0",
-                "id": req_id,
-                "error": {"code": -32000, "message": str(e)},
-            }
-            return JSONResponse(content=response)
-
-    # ---- notifications/initialized ----
-    elif method == "notifications/initialized":
-        print("✅ Acknowledged notifications/initialized")
-        return JSONResponse(
-            content={"jsonrpc": "2.0", "id": req_id, "result": {"ack": True}}
+    if not isinstance(params, dict):
+        return _invalid(
+            rpc, _INVALID_PARAMS_TEMPLATE, req_id, "Invalid params: params must be an object"
         )
 
-    # ---- notifications/cancelled ----
-    elif method == "notifications/cancelled":
-        print("ℹ️ Operation cancelled:", params)
-        return JSONResponse(
-            content={"jsonrpc": "2.0", "id": req_id, "result": {"ack": True}}
-        )
+    handler = HANDLERS.get(method)
+    if handler is None:
+        rpc["ok"], rpc["detail"] = False, "method not found"
+        return _method_not_found(req_id, method)
+    return await handler(req_id, params, request)
+
 
-    # ---- Unknown methods ----
-    else:
-        response = {
-            "jsonrpc": "2.0",
-            "id": req_id,
-            "error": {"code": -32601, "message": f"Method '{method}' not implemented"},
-        }
-        print(f"⚠️ Unknown method: {method}")
-        return JSONResponse(content=response)
+def _invalid(rpc, template, req_id, message):
+    """Record a rejected request on the rpc line and answer with a pre-encoded error."""
+    rpc["ok"], rpc["detail"] = False, message
+    return _json_bytes(_fill(template, req_id, _MESSAGE_SLOT, orjson.dumps(message)))
 
 
 # ------------------------------------------------------------
 # Optional SSE Stream
 # ------------------------------------------------------------
 @app.get("/")
-def sse_stream():
-    def stream():
-        yield f"data: {json.dumps({'event': 'ready', 'message': 'MCP Browser connected'})}\n\n"
-        while True:
-            time.sleep(10)
-            yield f"data: {json.dumps({'event': 'heartbeat', 'timestamp': time.time()})}\n\n"
+async def sse_stream(request: Request):
+    async def stream():
+        yield b"data: " + orjson.dumps({"event": "ready", "message": "MCP Browser connected"}) + b"\n\n"
+        while not await request.is_disconnected():
+            await asyncio.sleep(10)
+            yield b"data: " + orjson.dumps({"event": "heartbeat", "timestamp": time.time()}) + b"\n\n"
 
     headers = {
         "Cache-Control": "no-cache",
@@ -219,19 +809,46 @@ def sse_stream():
 
 
 # ------------------------------------------------------------
-# Shutdown Hook
+# Startup / Shutdown Hooks
 # ------------------------------------------------------------
+@app.on_event("startup")
+async def startup_event():
+    """Launch Chromium and warm the default session before serving requests."""
+    async with acquire_session(DEFAULT_SESSION):
+        pass
+
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    global browser_instance
+    global playwright_instance, browser_instance
+    _sessions.clear()
     if browser_instance:
-        print("🟥 Closing browser instance...")
+        log.info("🟥 Closing browser instance...")
         await browser_instance.close()
         browser_instance = None
+    if playwright_instance:
+        await playwright_instance.stop()
+        playwright_instance = None
+    _stop_logging()
 
 
 # ------------------------------------------------------------
 # Run command
 # ------------------------------------------------------------
-# python -m uvicorn mcp_browser_server:app --host 127.0.0.1 --port 3333
+# python -m uvicorn mcp_browser_server:app --host 127.0.0.1 --port 3333 --loop uvloop --http httptools
+#
+# Multi-core: add --workers N (or set MCP_WORKERS=N below). Each worker is a
+# separate process that launches its own Chromium and session pool in its
+# startup hook; nothing Playwright-related is shared between workers.
 # ------------------------------------------------------------
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "mcp_browser_server:app",
+        host="127.0.0.1",
+        port=3333,
+        loop="auto" if sys.platform == "win32" else "uvloop",  # no uvloop on Windows
+        http="httptools",
+        workers=int(os.environ.get("MCP_WORKERS", "1")),
+    )